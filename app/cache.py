@@ -0,0 +1,57 @@
+import hashlib
+import os
+
+from cachetools import TTLCache
+from dotenv import load_dotenv
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+SUMMARY_TTL = 3600
+CRAWL_TTL = 600
+VALIDATOR_TTL = 86400
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL")
+
+_redis = aioredis.from_url(REDIS_URL, decode_responses=True) if (aioredis and REDIS_URL) else None
+
+_local_summaries = TTLCache(maxsize=512, ttl=SUMMARY_TTL)
+_local_crawls = TTLCache(maxsize=128, ttl=CRAWL_TTL)
+_local_validators = TTLCache(maxsize=128, ttl=VALIDATOR_TTL)
+
+def summary_key(text: str, style: str) -> str:
+    digest = hashlib.sha256((style + "\0" + text).encode()).hexdigest()
+    return "sum:" + digest[:32]
+
+def crawl_key(url: str) -> str:
+    return "crawl:" + hashlib.sha256(url.encode()).hexdigest()[:32]
+
+def conditional_key(url: str) -> str:
+    return "cond:" + hashlib.sha256(url.encode()).hexdigest()[:32]
+
+def _local_for(key: str) -> TTLCache:
+    if key.startswith("crawl:"):
+        return _local_crawls
+    if key.startswith("cond:"):
+        return _local_validators
+    return _local_summaries
+
+async def cache_get(key: str) -> str | None:
+    if _redis is not None:
+        try:
+            return await _redis.get(key)
+        except Exception:
+            pass
+    return _local_for(key).get(key)
+
+async def cache_set(key: str, value: str, ttl: int) -> None:
+    if _redis is not None:
+        try:
+            await _redis.set(key, value, ex=ttl)
+            return
+        except Exception:
+            pass
+    _local_for(key)[key] = value
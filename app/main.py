@@ -3,26 +3,45 @@ import sys
 import asyncio
 import json
 import re
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
-from fastapi import FastAPI, Form, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+import orjson
+from fastapi import FastAPI, Form, HTTPException, Request, Response
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 import httpx
-from crawl4ai import AsyncWebCrawler
-import nest_asyncio
-from bs4 import BeautifulSoup
+
+from app.cache import (
+    CRAWL_TTL,
+    SUMMARY_TTL,
+    VALIDATOR_TTL,
+    cache_get,
+    cache_set,
+    conditional_key,
+    crawl_key,
+    summary_key,
+)
 
 if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
-nest_asyncio.apply()
+else:
+    import uvloop
+    uvloop.install()
 
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 if not GEMINI_API_KEY:
     raise RuntimeError("GEMINI_API_KEY not found")
 
-GEMINI_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+GEMINI_URL = f"{GEMINI_API_BASE}/models/gemini-2.0-flash:generateContent"
+GEMINI_STREAM_URL = f"{GEMINI_API_BASE}/models/gemini-2.0-flash:streamGenerateContent"
+GEMINI_CACHE_URL = f"{GEMINI_API_BASE}/cachedContents"
+GEMINI_MODEL = "models/gemini-2.0-flash"
+PROMPT_CACHE_TTL = 3600
+PROMPT_CACHE_REFRESH = 50 * 60
 
 class ArticleSummary(BaseModel):
     judul: str
@@ -63,34 +82,231 @@ STYLE_CONTEXTS = {
     }
 }
 
+_STYLE_KEYS = frozenset(STYLE_CONTEXTS)
+_INVALID_STYLE_ERROR = "Gaya '{style}' tidak valid. Pilih dari: " + ", ".join(STYLE_CONTEXTS)
+_STYLES_BODY = orjson.dumps({"success": True, "styles": STYLE_CONTEXTS})
+
+def build_prompt_prefix(style_config: dict) -> str:
+    return f"""
+    Analisis artikel berikut dan berikan ringkasan dalam format JSON yang valid dengan struktur:
+    {{
+        "judul": "judul artikel",
+        "tanggal": "tanggal publikasi atau 'tidak tersedia'",
+        "penulis": "nama penulis atau 'tidak tersedia'",
+        "ringkasan": "ringkasan artikel"
+    }}
+
+    INSTRUKSI GAYA PENULISAN:
+    {style_config["prompt_addition"]}
+
+    INSTRUKSI RINGKASAN:
+    Pelajari isi artikel yang sudah diberikan lalu berikan kepada saya penjelasan yang singkat, jelas, dan padat dari artikel tersebut. Buat ringkasan dalam bentuk paragraf sepanjang 5 kalimat dan pada setiap kalimat saya berharap Anda mencantumkan poin penting dari artikel yang telah dibaca.
+
+    Berikan dengan kata-kata Anda sendiri yang dapat mudah dipahami. Intinya bukan membahas tentang apa yang ada di dalam artikel, namun artikel tersebut membahas apa dan Anda menjelaskannya kepada saya, layaknya seorang dosen yang membaca buku lalu memberikan penjelasan terhadap mahasiswanya.
+
+    PENTING: Gunakan bahasa Indonesia yang sesuai dengan gaya "{style_config['name']}" yang telah dipilih.
+    """
+
+_PROMPT_PREFIX = {
+    style: build_prompt_prefix(style_config) + "\n    Artikel:\n    "
+    for style, style_config in STYLE_CONTEXTS.items()
+}
+
+_PROMPT_CACHE_NAMES: dict[str, str | None] = {}
+
+async def _register_prompt_cache(client: httpx.AsyncClient, style: str, style_config: dict):
+    try:
+        resp = await client.post(
+            GEMINI_CACHE_URL,
+            params={"key": GEMINI_API_KEY},
+            json={
+                "model": GEMINI_MODEL,
+                "contents": [{"role": "user", "parts": [{"text": build_prompt_prefix(style_config)}]}],
+                "ttl": f"{PROMPT_CACHE_TTL}s"
+            },
+            timeout=10
+        )
+        resp.raise_for_status()
+        _PROMPT_CACHE_NAMES[style] = resp.json()["name"]
+    except Exception:
+        _PROMPT_CACHE_NAMES[style] = None
+
+async def init_prompt_caches(client: httpx.AsyncClient):
+    await asyncio.gather(*(
+        _register_prompt_cache(client, style, style_config)
+        for style, style_config in STYLE_CONTEXTS.items()
+    ))
+
+async def manage_prompt_caches(client: httpx.AsyncClient):
+    await init_prompt_caches(client)
+    await refresh_prompt_caches(client)
+
+async def refresh_prompt_caches(client: httpx.AsyncClient):
+    while True:
+        await asyncio.sleep(PROMPT_CACHE_REFRESH)
+        for style, cache_name in _PROMPT_CACHE_NAMES.items():
+            if not cache_name:
+                continue
+            try:
+                resp = await client.patch(
+                    f"{GEMINI_API_BASE}/{cache_name}",
+                    params={"key": GEMINI_API_KEY},
+                    json={"ttl": f"{PROMPT_CACHE_TTL}s"}
+                )
+                resp.raise_for_status()
+            except Exception:
+                _PROMPT_CACHE_NAMES[style] = None
+
 def clean_html(html: str) -> str:
-    soup = BeautifulSoup(html, "html.parser")
-    for tag in soup(["script", "style", "noscript"]):
-        tag.decompose()
-    main_content = soup.find("article") or soup.find("main") or soup.find("body") or soup
-    return main_content.get_text(separator="\n", strip=True)
+    from selectolax.lexbor import LexborHTMLParser
+    try:
+        tree = LexborHTMLParser(html)
+        for sel in ("script", "style", "noscript"):
+            for node in tree.css(sel):
+                node.decompose()
+        node = tree.css_first("article") or tree.css_first("main") or tree.body
+        return node.text(separator="\n", strip=True) if node else ""
+    except Exception:
+        from lxml import etree
+        parser = etree.HTMLParser(huge_tree=True)
+        root = etree.fromstring(html.encode("utf-8", "ignore"), parser)
+        if root is None:
+            return ""
+        for bad in root.iter("script", "style", "noscript"):
+            parent = bad.getparent()
+            if parent is not None:
+                parent.remove(bad)
+        for tag in ("article", "main", "body"):
+            node = root.find(f".//{tag}")
+            if node is not None:
+                return "\n".join(s.strip() for s in node.itertext() if s.strip())
+        return ""
+
+MIN_ARTICLE_CHARS = 500
+MAX_FETCH_BYTES = 2_000_000
+MAX_ARTICLE_BYTES = 5_000_000
+
+_FETCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
+    "Accept-Encoding": "gzip, br"
+}
+
+_needs_js: dict[str, bool] = {}
+
+_crawler_sem = asyncio.Semaphore(4)
+_crawler_lock = asyncio.Lock()
+_CrawlerCls = None
+
+def _get_crawler_cls():
+    global _CrawlerCls
+    if _CrawlerCls is None:
+        from crawl4ai import AsyncWebCrawler
+        _CrawlerCls = AsyncWebCrawler
+    return _CrawlerCls
+
+async def get_crawler():
+    async with _crawler_lock:
+        if app.state.crawler is None and not app.state.crawler_failed:
+            try:
+                crawler = _get_crawler_cls()(headless=True, verbose=False)
+                await crawler.__aenter__()
+                app.state.crawler = crawler
+            except Exception:
+                app.state.crawler_failed = True
+    return app.state.crawler
+
+async def clean_html_async(html: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(app.state.pool, clean_html, html)
+
+async def crawl_url(url: str, client: httpx.AsyncClient) -> str:
+    key = crawl_key(url)
+    cached = await cache_get(key)
+    if cached is not None:
+        return cached
 
-async def crawl_url(url: str) -> str:
     try:
-        async with AsyncWebCrawler(headless=True, verbose=False) as crawler:
-            result = await crawler.arun(url=url, word_count_threshold=1)
-            if getattr(result, "markdown", None):
-                return result.markdown
-            if getattr(result, "cleaned_html", None):
-                return clean_html(result.cleaned_html)
+        head = await client.head(url, headers=_FETCH_HEADERS, timeout=10, follow_redirects=True)
     except Exception:
-        pass
+        head = None
+    if head is not None and head.status_code < 400:
+        content_type = head.headers.get("content-type", "")
+        if content_type and "html" not in content_type:
+            raise HTTPException(415, f"Tipe konten tidak didukung: {content_type}")
+        if int(head.headers.get("content-length", "0") or 0) > MAX_ARTICLE_BYTES:
+            raise HTTPException(413, "Artikel terlalu besar untuk diringkas.")
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        resp = await client.get(url)
-        resp.raise_for_status()
-        return clean_html(resp.text)
+    cond_key = conditional_key(url)
+    validators = None
+    raw_validators = await cache_get(cond_key)
+    if raw_validators is not None:
+        try:
+            validators = json.loads(raw_validators)
+        except json.JSONDecodeError:
+            validators = None
+
+    netloc = urlsplit(url).netloc
+    if not _needs_js.get(netloc):
+        try:
+            headers = dict(_FETCH_HEADERS)
+            if validators:
+                if validators.get("etag"):
+                    headers["If-None-Match"] = validators["etag"]
+                if validators.get("last_modified"):
+                    headers["If-Modified-Since"] = validators["last_modified"]
+
+            async with client.stream("GET", url, headers=headers, timeout=30, follow_redirects=True) as resp:
+                if resp.status_code == 304 and validators:
+                    text = validators["body"]
+                    await cache_set(key, text, CRAWL_TTL)
+                    return text
+                resp.raise_for_status()
+                buf = bytearray()
+                async for chunk in resp.aiter_bytes():
+                    buf += chunk
+                    if len(buf) > MAX_FETCH_BYTES:
+                        break
+            text = await clean_html_async(bytes(buf).decode(resp.encoding or "utf-8", "ignore"))
+            if len(text) >= MIN_ARTICLE_CHARS:
+                await cache_set(key, text, CRAWL_TTL)
+                etag = resp.headers.get("etag")
+                last_modified = resp.headers.get("last-modified")
+                if etag or last_modified:
+                    await cache_set(
+                        cond_key,
+                        json.dumps({"etag": etag, "last_modified": last_modified, "body": text}),
+                        VALIDATOR_TTL
+                    )
+                return text
+            _needs_js[netloc] = True
+        except Exception:
+            pass
+
+    text = ""
+    crawler = await get_crawler()
+    if crawler is not None:
+        try:
+            async with _crawler_sem:
+                result = await crawler.arun(url=url, word_count_threshold=1)
+            if getattr(result, "markdown", None):
+                text = result.markdown
+            elif getattr(result, "cleaned_html", None):
+                text = await clean_html_async(result.cleaned_html)
+        except Exception:
+            pass
+
+    if text:
+        await cache_set(key, text, CRAWL_TTL)
+    return text
+
+_FENCE_HEAD = re.compile(r"^```(?:json)?\s*", re.I)
+_FENCE_TAIL = re.compile(r"\s*```$")
 
 def safe_extract_json(raw: str) -> dict:
-    s = raw.strip()
-    if s.startswith("```"):
-        s = re.sub(r"^```(?:json)?\s*", "", s, flags=re.I)
-        s = re.sub(r"\s*```$", "", s)
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError:
+        pass
+    s = _FENCE_TAIL.sub("", _FENCE_HEAD.sub("", raw.strip()))
     try:
         return json.loads(s)
     except json.JSONDecodeError:
@@ -100,55 +316,140 @@ def safe_extract_json(raw: str) -> dict:
             return json.loads(s[start:end+1])
         raise
 
-async def summarize_with_gemini(text: str, style: str = "casual") -> ArticleSummary:
-    if len(text) > 10000:
-        text = text[:10000]
+def build_gemini_payload(text: str, style: str) -> dict:
+    if style not in STYLE_CONTEXTS:
+        style = "casual"
+    cache_name = _PROMPT_CACHE_NAMES.get(style)
+    if cache_name:
+        return {
+            "contents": [{"parts": [{"text": f"Artikel:\n{text}"}]}],
+            "cachedContent": cache_name
+        }
+    prompt = _PROMPT_PREFIX.get(style, _PROMPT_PREFIX["casual"]) + text
+    return {"contents": [{"parts": [{"text": prompt}]}]}
 
-    style_config = STYLE_CONTEXTS.get(style, STYLE_CONTEXTS["casual"])
-    style_instruction = style_config["prompt_addition"]
+TOKEN_BUDGET = 3000
+CHARS_PER_TOKEN = 4
 
-    prompt = f"""
-    Analisis artikel berikut dan berikan ringkasan dalam format JSON yang valid dengan struktur:
-    {{
-        "judul": "judul artikel",
-        "tanggal": "tanggal publikasi atau 'tidak tersedia'",
-        "penulis": "nama penulis atau 'tidak tersedia'", 
-        "ringkasan": "ringkasan artikel"
-    }}
+def truncate_article(text: str) -> str:
+    budget_chars = TOKEN_BUDGET * CHARS_PER_TOKEN
+    if len(text) <= budget_chars:
+        return text
+    head = text[:int(0.7 * budget_chars)]
+    tail = text[-int(0.3 * budget_chars):]
+    return head + "\n...\n" + tail
 
-    INSTRUKSI GAYA PENULISAN:
-    {style_instruction}
+_gemini_sem = asyncio.Semaphore(16)
+_inflight: dict[str, asyncio.Future] = {}
 
-    INSTRUKSI RINGKASAN:
-    Pelajari isi artikel yang sudah diberikan lalu berikan kepada saya penjelasan yang singkat, jelas, dan padat dari artikel tersebut. Buat ringkasan dalam bentuk paragraf sepanjang 5 kalimat dan pada setiap kalimat saya berharap Anda mencantumkan poin penting dari artikel yang telah dibaca. 
+async def summarize_with_gemini(text: str, style: str, client: httpx.AsyncClient) -> tuple[ArticleSummary, str]:
+    text = truncate_article(text)
 
-    Berikan dengan kata-kata Anda sendiri yang dapat mudah dipahami. Intinya bukan membahas tentang apa yang ada di dalam artikel, namun artikel tersebut membahas apa dan Anda menjelaskannya kepada saya, layaknya seorang dosen yang membaca buku lalu memberikan penjelasan terhadap mahasiswanya.
+    key = summary_key(text, style)
+    cached = await cache_get(key)
+    if cached is not None:
+        return ArticleSummary.model_validate_json(cached), "HIT"
 
-    PENTING: Gunakan bahasa Indonesia yang sesuai dengan gaya "{style_config['name']}" yang telah dipilih.
-    
-    Artikel:
-    {text}
-    """
+    pending = _inflight.get(key)
+    if pending is not None:
+        return await pending, "HIT"
 
-    payload = {"contents": [{"parts": [{"text": prompt}]}]}
+    future = asyncio.get_running_loop().create_future()
+    _inflight[key] = future
+    try:
+        payload = build_gemini_payload(text, style)
 
-    async with httpx.AsyncClient(timeout=60) as client:
-        resp = await client.post(
-            GEMINI_URL,
-            params={"key": GEMINI_API_KEY},
-            json=payload
-        )
-        resp.raise_for_status()
-        data = resp.json()
+        async with _gemini_sem:
+            resp = await client.post(
+                GEMINI_URL,
+                params={"key": GEMINI_API_KEY},
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"}
+            )
+            resp.raise_for_status()
+            data = orjson.loads(resp.content)
+
+        raw_text = data["candidates"][0]["content"]["parts"][0]["text"].strip()
+        parsed_json = safe_extract_json(raw_text)
+
+        summary = ArticleSummary(**parsed_json)
+        await cache_set(key, summary.model_dump_json(), SUMMARY_TTL)
+        future.set_result(summary)
+        return summary, "MISS"
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+def sse_event(obj: dict) -> str:
+    return f"data: {json.dumps(obj)}\n\n"
+
+async def stream_summary_events(url: str, style: str, client: httpx.AsyncClient):
+    try:
+        text = await crawl_url(url, client)
+        if not text or len(text.strip()) < 100:
+            yield sse_event({"error": "Artikel terlalu pendek atau tidak dapat diambil. Pastikan URL artikel valid."})
+            return
+
+        text = truncate_article(text)
 
-    raw_text = data["candidates"][0]["content"]["parts"][0]["text"].strip()
-    parsed_json = safe_extract_json(raw_text)
+        payload = build_gemini_payload(text, style)
 
-    return ArticleSummary(**parsed_json)
+        buf = []
+        async with client.stream(
+            "POST",
+            GEMINI_STREAM_URL,
+            params={"key": GEMINI_API_KEY, "alt": "sse"},
+            content=orjson.dumps(payload),
+            headers={"Content-Type": "application/json"}
+        ) as resp:
+            resp.raise_for_status()
+            async for line in resp.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                try:
+                    chunk = json.loads(line[6:])
+                except json.JSONDecodeError:
+                    continue
+                for part in chunk.get("candidates", [{}])[0].get("content", {}).get("parts", []):
+                    piece = part.get("text", "")
+                    if piece:
+                        buf.append(piece)
+                        yield sse_event({"chunk": piece})
 
-app = FastAPI()
+        summary = ArticleSummary(**safe_extract_json("".join(buf)))
+        await cache_set(summary_key(text, style), summary.model_dump_json(), SUMMARY_TTL)
+        yield sse_event({"done": True, "data": summary.model_dump()})
+    except HTTPException as e:
+        yield sse_event({"error": e.detail})
+    except Exception as e:
+        yield sse_event({"error": f"Gagal memproses artikel: {str(e)}"})
+
+app = FastAPI(default_response_class=ORJSONResponse)
 templates = Jinja2Templates(directory="app/templates")
 
+@app.on_event("startup")
+async def startup():
+    app.state.pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    app.state.http = httpx.AsyncClient(
+        http2=True,
+        timeout=60,
+        limits=httpx.Limits(max_keepalive_connections=64, max_connections=128)
+    )
+    app.state.crawler = None
+    app.state.crawler_failed = False
+    app.state.prompt_cache_task = asyncio.create_task(manage_prompt_caches(app.state.http))
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.prompt_cache_task.cancel()
+    if app.state.crawler is not None:
+        await app.state.crawler.__aexit__(None, None, None)
+    await app.state.http.aclose()
+    app.state.pool.shutdown(wait=False)
+
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     return templates.TemplateResponse("gemini.html", {"request": request})
@@ -156,45 +457,67 @@ async def home(request: Request):
 @app.post("/summarize")
 async def summarize(url: str = Form(...), style: str = Form("casual")):
     try:
-        if style not in STYLE_CONTEXTS:
-            return JSONResponse({
+        if style not in _STYLE_KEYS:
+            return ORJSONResponse({
                 "success": False,
-                "error": f"Gaya '{style}' tidak valid. Pilih dari: {', '.join(STYLE_CONTEXTS.keys())}"
+                "error": _INVALID_STYLE_ERROR.format(style=style)
             })
 
         if not url.startswith(("http://", "https://")):
             url = "https://" + url
 
-        article_text = await crawl_url(url)
+        article_text = await crawl_url(url, app.state.http)
         if not article_text or len(article_text.strip()) < 100:
-            return JSONResponse({
+            return ORJSONResponse({
                 "success": False,
                 "error": "Artikel terlalu pendek atau tidak dapat diambil. Pastikan URL artikel valid."
             })
 
-        summary = await summarize_with_gemini(article_text, style)
+        summary, cache_status = await summarize_with_gemini(article_text, style, app.state.http)
 
-        return JSONResponse({
+        return ORJSONResponse({
             "success": True,
             "data": summary.model_dump(),
             "url": url,
             "style": style,
             "style_info": STYLE_CONTEXTS[style]
-        })
+        }, headers={"X-Cache": cache_status})
 
+    except HTTPException as e:
+        return ORJSONResponse({
+            "success": False,
+            "error": e.detail
+        }, status_code=e.status_code)
     except Exception as e:
-        return JSONResponse({
+        return ORJSONResponse({
             "success": False,
             "error": f"Gagal memproses artikel: {str(e)}"
         })
 
+@app.post("/summarize/stream")
+async def summarize_stream(url: str = Form(...), style: str = Form("casual")):
+    if style not in _STYLE_KEYS:
+        return ORJSONResponse({
+            "success": False,
+            "error": _INVALID_STYLE_ERROR.format(style=style)
+        })
+
+    if not url.startswith(("http://", "https://")):
+        url = "https://" + url
+
+    return StreamingResponse(
+        stream_summary_events(url, style, app.state.http),
+        media_type="text/event-stream"
+    )
+
 @app.get("/styles")
 async def get_styles():
-    return JSONResponse({
-        "success": True,
-        "styles": STYLE_CONTEXTS
-    })
+    return Response(
+        content=_STYLES_BODY,
+        media_type="application/json",
+        headers={"Cache-Control": "public, max-age=86400"}
+    )
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, workers=os.cpu_count())
\ No newline at end of file
@@ -2,19 +2,18 @@ import os
 import sys
 import asyncio
 import json
+import orjson
 from fastapi import FastAPI, Form, Request
 from fastapi.responses import JSONResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 import httpx
 from crawl4ai import AsyncWebCrawler
-import nest_asyncio
+from selectolax.lexbor import LexborHTMLParser
 
 if sys.platform.startswith("win"):
     asyncio.set_event_loop_policy(asyncio.WindowsProactorEventLoopPolicy())
 
-nest_asyncio.apply()
-
 OLLAMA_HOST = "http://192.168.100.3:11434"
 OLLAMA_MODEL = "llama3.2:latest"
 
@@ -26,6 +25,14 @@ class ArticleSummary(BaseModel):
     penulis: str
     ringkasan: str
 
+def clean_html(html: str) -> str:
+    tree = LexborHTMLParser(html)
+    for sel in ("script", "style", "noscript"):
+        for node in tree.css(sel):
+            node.decompose()
+    node = tree.css_first("article") or tree.css_first("main") or tree.body
+    return node.text(separator="\n", strip=True) if node else ""
+
 async def crawl_url(url: str) -> str:
     try:
         async with AsyncWebCrawler(headless=True, verbose=False) as crawler:
@@ -34,7 +41,7 @@ async def crawl_url(url: str) -> str:
     except Exception:
         async with httpx.AsyncClient(timeout=30) as client:
             response = await client.get(url)
-            return response.text
+            return clean_html(response.text)
 
 async def summarize_with_ollama(text: str) -> ArticleSummary:
     if len(text) > 10000:
@@ -51,10 +58,11 @@ async def summarize_with_ollama(text: str) -> ArticleSummary:
     async with httpx.AsyncClient(timeout=120) as client:
         resp = await client.post(
             f"{OLLAMA_HOST}/api/generate",
-            json={"model": OLLAMA_MODEL, "prompt": summary_prompt, "stream": False}
+            content=orjson.dumps({"model": OLLAMA_MODEL, "prompt": summary_prompt, "stream": False}),
+            headers={"Content-Type": "application/json"}
         )
         resp.raise_for_status()
-        raw_summary = resp.json().get("response", "").strip()
+        raw_summary = orjson.loads(resp.content).get("response", "").strip()
 
     print("\n=== RAW SUMMARY OLLAMA ===")
     print(raw_summary)